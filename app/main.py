@@ -8,8 +8,8 @@ from dotenv import load_dotenv
 
 from .utils.db import db, init_db
 from .utils.auth import password_hash, verify_password, require_roles
-from .utils.cert_generator import generate_certificate_png
-from .utils.emailer import send_certificate_email
+from .utils.cert_generator import generate_certificate_png, compile_template, compiled_paths
+from .utils.emailer import send_certificates
 from sqlalchemy import or_
 
 load_dotenv()
@@ -245,6 +245,7 @@ def generate_all():
 	if not participants:
 		flash("No participants found", "warning")
 		return redirect(url_for("index"))
+	_ensure_compiled(template)
 	out_dir = os.path.join(app.root_path, "static", "certificates")
 	os.makedirs(out_dir, exist_ok=True)
 	generated = 0
@@ -268,36 +269,61 @@ def generate_all():
 	return redirect(url_for("index"))
 
 
-@app.route("/send_all", methods=["POST"]) 
-@require_roles("admin", "superadmin", "club")
-def send_all():
-	role = session.get("role")
-	club = session.get("club")
-	q = Participant.query
-	if role == "club":
-		q = q.filter_by(club=club)
-	participants = q.all()
-	sent = 0
+def _send_pending_certificates(participants) -> int:
+	"""Email the latest generated certificate of each participant, one message per recipient address.
+	Updates participant and log statuses; returns the number of certificates delivered."""
+	pending = []
 	for p in participants:
 		log = CertificateLog.query.filter_by(participant_id=p.id).order_by(CertificateLog.id.desc()).first()
 		# Only send if we have a generated file present
 		if not log or not os.path.exists(log.file_path):
 			continue
-		ok = send_certificate_email(
-			to_email=p.email,
-			subject=f"Your Certificate for {p.event}",
-			body=f"Hello {p.name},\n\nPlease find attached your certificate for {p.event}.\n\nRegards,\nEventEye",
-			attachment_path=log.file_path,
-		)
+		pending.append((p, log))
+	results = send_certificates([(p.email, p.name, p.event or "", log.file_path) for p, log in pending])
+	sent = 0
+	for (p, log), ok in zip(pending, results):
 		log.email_status = "sent" if ok else "bounced"
 		p.status = "emailed" if ok else "bounced"
 		if ok:
 			sent += 1
+	return sent
+
+
+@app.route("/send_all", methods=["POST"]) 
+@require_roles("admin", "superadmin", "club")
+def send_all():
+	role = session.get("role")
+	club = session.get("club")
+	q = Participant.query
+	if role == "club":
+		q = q.filter_by(club=club)
+	participants = q.all()
+	sent = _send_pending_certificates(participants)
 	db.session.commit()
 	flash(f"Emails sent: {sent}", "success")
 	return redirect(url_for("index"))
 
 
+def _thumbnail_path(file_path: str) -> str:
+	return os.path.join(app.static_folder, "thumbs", os.path.basename(file_path) + ".png")
+
+
+def _ensure_compiled(template) -> None:
+	"""Backfill the raster, layout and thumbnail for templates uploaded before precompilation.
+	Failures are ignored; rendering then falls back to decoding the image."""
+	raster_path, layout_path = compiled_paths(template.file_path)
+	thumb_path = _thumbnail_path(template.file_path)
+	if all(os.path.exists(p) for p in (raster_path, layout_path, thumb_path)):
+		return
+	if not (os.path.exists(template.file_path) and os.path.exists(template.coordinates_path)):
+		return
+	os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+	try:
+		compile_template(template.file_path, template.coordinates_path, thumb_path)
+	except (ValueError, OSError):
+		pass
+
+
 @app.route("/templates", methods=["GET", "POST"]) 
 @require_roles("admin", "superadmin")
 def manage_templates():
@@ -315,13 +341,32 @@ def manage_templates():
 		file.save(file_path)
 		coord_path = os.path.join(upload_dir, f"{uuid.uuid4()}_{coords.filename}")
 		coords.save(coord_path)
+		thumb_path = _thumbnail_path(file_path)
+		os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+		try:
+			layout = compile_template(file_path, coord_path, thumb_path)
+		except (ValueError, OSError) as e:
+			raster_path, layout_path = compiled_paths(file_path)
+			for path in (file_path, coord_path, thumb_path, raster_path, raster_path + ".tmp", layout_path):
+				if os.path.exists(path):
+					os.remove(path)
+			label = "Invalid template" if isinstance(e, ValueError) else "Could not save template"
+			flash(f"{label}: {e}", "error")
+			return redirect(url_for("manage_templates"))
+		for warning in layout["warnings"]:
+			flash(warning, "warning")
 		t = Template(club=club, name=name, file_path=file_path, coordinates_path=coord_path)
 		db.session.add(t)
 		db.session.commit()
 		flash("Template uploaded", "success")
 		return redirect(url_for("manage_templates"))
 	templates = Template.query.order_by(Template.id.desc()).all()
-	return render_template("templates.html", templates=templates)
+	thumbs = {}
+	for t in templates:
+		_ensure_compiled(t)
+		if os.path.exists(_thumbnail_path(t.file_path)):
+			thumbs[t.id] = url_for("static", filename=f"thumbs/{os.path.basename(t.file_path)}.png")
+	return render_template("templates.html", templates=templates, thumbs=thumbs)
 
 
 @app.route("/generate", methods=["POST"]) 
@@ -346,6 +391,7 @@ def generate_batch():
 		q = q.filter_by(club=club)
 	q = q.filter(Participant.id.in_(selected_ids))
 	participants = q.all()
+	_ensure_compiled(template)
 	out_dir = os.path.join(app.root_path, "static", "certificates")
 	os.makedirs(out_dir, exist_ok=True)
 	generated = 0
@@ -390,18 +436,7 @@ def send_emails():
 		q = q.filter_by(club=club)
 	q = q.filter(Participant.id.in_(selected_ids))
 	participants = q.all()
-	sent = 0
-	for p in participants:
-		log = CertificateLog.query.filter_by(participant_id=p.id).order_by(CertificateLog.id.desc()).first()
-		if not log or not os.path.exists(log.file_path):
-			continue
-		subject = f"Your Certificate for {p.event}"
-		body = f"Hello {p.name},\n\nPlease find attached your certificate for {p.event}.\n\nRegards,\nEventEye"
-		ok = send_certificate_email(to_email=p.email, subject=subject, body=body, attachment_path=log.file_path)
-		log.email_status = "sent" if ok else "bounced"
-		p.status = "emailed" if ok else "bounced"
-		if ok:
-			sent += 1
+	sent = _send_pending_certificates(participants)
 	db.session.commit()
 	flash(f"Emails sent: {sent}", "success")
 	return redirect(url_for("index"))
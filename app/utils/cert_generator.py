@@ -1,15 +1,134 @@
 import json
-from typing import Dict, Optional
+import mmap
+from typing import Dict, Optional, Tuple
 from PIL import Image, ImageDraw, ImageFont
 import os
 import qrcode
 
+THUMBNAIL_SIZE = (320, 240)
+
+# Per-process cache of memory-mapped template rasters: raster_path -> (mmap, layout).
+# The mapping is read-only and backed by the page cache, so workers share the source
+# pixels; each render still takes one private copy to draw on.
+_raster_cache: Dict[str, Tuple[mmap.mmap, Dict]] = {}
+
 
 def _load_coordinates(path: str) -> Dict:
 	with open(path, "r", encoding="utf-8") as f:
 		return json.load(f)
 
 
+def compiled_paths(template_path: str) -> Tuple[str, str]:
+	"""Return (raster_path, layout_path) for the precompiled form of a template image."""
+	return template_path + ".rgb", template_path + ".layout.json"
+
+
+def _parse_layout(coords: Dict, width: int, height: int) -> Dict:
+	"""Validate a coordinates mapping against the image size and normalise it.
+	Fields outside the image and a QR box that overflows it are kept (the QR box is
+	moved or shrunk to fit) and reported in layout["warnings"].
+	Raises ValueError for malformed entries.
+	"""
+	if not isinstance(coords, dict):
+		raise ValueError("Coordinates file must contain a JSON object")
+	fields = coords.get("fields", {})
+	if not isinstance(fields, dict):
+		raise ValueError("'fields' must be an object")
+	layout = {"width": width, "height": height, "mode": "RGB", "fields": {}, "qr": None, "warnings": []}
+	for key, meta in fields.items():
+		try:
+			x, y = int(meta.get("x", 0)), int(meta.get("y", 0))
+			font_size = int(meta.get("font_size", 36))
+		except (AttributeError, TypeError, ValueError):
+			raise ValueError(f"Field '{key}' has invalid coordinates")
+		if font_size <= 0:
+			raise ValueError(f"Field '{key}' has a non-positive font_size")
+		if not (0 <= x < width and 0 <= y < height):
+			layout["warnings"].append(f"Field '{key}' at ({x}, {y}) is outside the {width}x{height} template")
+		layout["fields"][key] = {
+			"x": x,
+			"y": y,
+			"font_path": meta.get("font_path"),
+			"font_size": font_size,
+			"color": meta.get("color", "#000000"),
+			"anchor": meta.get("anchor", "mm"),
+		}
+	qr_meta = coords.get("qr")
+	if qr_meta:
+		try:
+			x, y = int(qr_meta.get("x", 0)), int(qr_meta.get("y", 0))
+			size = int(qr_meta.get("size", 180))
+		except (AttributeError, TypeError, ValueError):
+			raise ValueError("'qr' has invalid coordinates")
+		if size <= 0:
+			raise ValueError("'qr' has a non-positive size")
+		fit_size = min(size, width, height)
+		fit_x = min(max(x, 0), width - fit_size)
+		fit_y = min(max(y, 0), height - fit_size)
+		if (fit_x, fit_y, fit_size) != (x, y, size):
+			layout["warnings"].append(
+				f"QR box at ({x}, {y}) size {size} does not fit the {width}x{height} template; "
+				f"using ({fit_x}, {fit_y}) size {fit_size}"
+			)
+		layout["qr"] = {"x": fit_x, "y": fit_y, "size": fit_size}
+	return layout
+
+
+def compile_template(template_path: str, coordinates_path: str, thumbnail_path: str) -> Dict:
+	"""Validate an uploaded template against its coordinates file and precompile it.
+	Writes a raw RGB raster and parsed layout next to the template, plus a PNG thumbnail.
+	Returns the layout metadata, including any "warnings".
+	Raises ValueError if the image or coordinates are invalid, OSError if writing fails.
+	"""
+	try:
+		with Image.open(template_path) as src:
+			img = src.convert("RGB")
+	except (OSError, Image.DecompressionBombError):
+		raise ValueError("Template is not a readable image")
+	try:
+		coords = _load_coordinates(coordinates_path)
+	except (OSError, UnicodeDecodeError, json.JSONDecodeError):
+		raise ValueError("Coordinates file is not valid JSON")
+	layout = _parse_layout(coords, img.width, img.height)
+
+	raster_path, layout_path = compiled_paths(template_path)
+	tmp_path = raster_path + ".tmp"
+	with open(tmp_path, "wb") as f:
+		f.write(img.tobytes())
+	os.replace(tmp_path, raster_path)
+	with open(layout_path, "w", encoding="utf-8") as f:
+		json.dump(layout, f)
+
+	thumb = img.copy()
+	thumb.thumbnail(THUMBNAIL_SIZE)
+	thumb.save(thumbnail_path, format="PNG")
+	return layout
+
+
+def _load_compiled(template_path: str) -> Optional[Tuple[Image.Image, Dict]]:
+	"""Return a fresh drawable copy of a precompiled template and its layout, or None if not compiled."""
+	raster_path, layout_path = compiled_paths(template_path)
+	cached = _raster_cache.get(raster_path)
+	if cached is None:
+		if not (os.path.exists(raster_path) and os.path.exists(layout_path)):
+			return None
+		# Corrupt or truncated artifacts fall back to decoding the template image
+		try:
+			layout = _load_coordinates(layout_path)
+			expected = layout["width"] * layout["height"] * 3
+			with open(raster_path, "rb") as f:
+				mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		except (OSError, ValueError, KeyError, TypeError):
+			return None
+		if len(mapped) != expected:
+			mapped.close()
+			return None
+		cached = _raster_cache[raster_path] = (mapped, layout)
+	mapped, layout = cached
+	size = (layout["width"], layout["height"])
+	return Image.frombytes("RGB", size, mapped), layout
+
+
 def _get_font(font_path: Optional[str], font_size: int) -> ImageFont.FreeTypeFont:
 	"""Load a TrueType font honoring font_size. Fallback to DejaVuSans bundled with PIL when font_path is None.
 	Using ImageFont.load_default() ignores font_size, so avoid it for dynamic rendering.
@@ -55,9 +174,14 @@ def _paste_qr(image: Image.Image, value: str, x: int, y: int, size: int) -> None
 
 
 def generate_certificate_png(template_path: str, coordinates_path: str, fields: Dict[str, str], qr_value: Optional[str], output_path: str) -> str:
-	base = Image.open(template_path).convert("RGB")
+	compiled = _load_compiled(template_path)
+	if compiled:
+		base, coords = compiled
+	else:
+		base = Image.open(template_path).convert("RGB")
+		# Normalise exactly as compile_template does so both paths render identically
+		coords = _parse_layout(_load_coordinates(coordinates_path), base.width, base.height)
 	draw = ImageDraw.Draw(base)
-	coords = _load_coordinates(coordinates_path)
 
 	# Draw dynamic fields
 	for key, meta in coords.get("fields", {}).items():
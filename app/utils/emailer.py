@@ -1,37 +1,181 @@
 import os
 import smtplib
 from email.message import EmailMessage
-from typing import Optional
+from string import Template
+from typing import Dict, List, Optional, Sequence, Tuple
 
+# Precompiled subject/body templates, rendered once per coalesced message.
+SUBJECT_TEMPLATE = Template("Your $noun for $events")
+BODY_TEMPLATE = Template("Hello $name,\n\nPlease find attached your $lower_noun for $events.\n\nRegards,\nEventEye")
 
-def send_certificate_email(to_email: str, subject: str, body: str, attachment_path: Optional[str]) -> bool:
-	"""Send email via SMTP using ENV: SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, SMTP_FROM, SMTP_TLS=1"""
+# Size-cap allowances for MIME part headers and the message headers/text body.
+ATTACHMENT_HEADER_BYTES = 256
+MESSAGE_OVERHEAD_BYTES = 4096
+
+# (to_email, name, event, attachment_path)
+PendingCertificate = Tuple[str, str, str, str]
+
+
+def _smtp_settings() -> Dict:
+	"""Read ENV: SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, SMTP_FROM, SMTP_TLS=1, SMTP_MAX_MESSAGE_BYTES"""
+	user = os.getenv("SMTP_USER")
+	return {
+		"host": os.getenv("SMTP_HOST", "smtp.gmail.com"),
+		"port": int(os.getenv("SMTP_PORT", "587")),
+		"user": user,
+		"pwd": os.getenv("SMTP_PASS"),
+		"mail_from": os.getenv("SMTP_FROM", user or "noreply@example.com"),
+		"use_tls": os.getenv("SMTP_TLS", "1") == "1",
+		"max_bytes": int(os.getenv("SMTP_MAX_MESSAGE_BYTES", str(20 * 1024 * 1024))),
+	}
+
+
+def _connect(cfg: Dict) -> smtplib.SMTP:
+	s = smtplib.SMTP(cfg["host"], cfg["port"], timeout=20)
 	try:
-		host = os.getenv("SMTP_HOST", "smtp.gmail.com")
-		port = int(os.getenv("SMTP_PORT", "587"))
-		user = os.getenv("SMTP_USER")
-		pwd = os.getenv("SMTP_PASS")
-		mail_from = os.getenv("SMTP_FROM", user or "noreply@example.com")
-		use_tls = os.getenv("SMTP_TLS", "1") == "1"
-
-		msg = EmailMessage()
-		msg["From"] = mail_from
-		msg["To"] = to_email
-		msg["Subject"] = subject
-		msg.set_content(body)
-
-		if attachment_path:
-			with open(attachment_path, "rb") as f:
-				data = f.read()
-				msg.add_attachment(data, maintype="image", subtype="png", filename=os.path.basename(attachment_path))
-
-		s = smtplib.SMTP(host, port, timeout=20)
-		if use_tls:
+		if cfg["use_tls"]:
 			s.starttls()
-		if user and pwd:
-			s.login(user, pwd)
-		s.send_message(msg)
-		s.quit()
+		if cfg["user"] and cfg["pwd"]:
+			s.login(cfg["user"], cfg["pwd"])
+	except Exception:
+		_close(s)
+		raise
+	return s
+
+
+def render_certificate_text(name: str, events: Sequence[str]) -> Tuple[str, str]:
+	"""Render (subject, body) for one or more events from the precompiled templates."""
+	events = list(dict.fromkeys(e for e in events if e)) or [""]
+	noun = "Certificate" if len(events) == 1 else "Certificates"
+	values = {"name": name, "events": ", ".join(events), "noun": noun, "lower_noun": noun.lower()}
+	return SUBJECT_TEMPLATE.substitute(values), BODY_TEMPLATE.substitute(values)
+
+
+def _build_message(mail_from: str, to_email: str, subject: str, body: str, attachments: Sequence[Tuple[str, bytes]]) -> EmailMessage:
+	msg = EmailMessage()
+	msg["From"] = mail_from
+	msg["To"] = to_email
+	msg["Subject"] = subject
+	msg.set_content(body)
+	for filename, data in attachments:
+		msg.add_attachment(data, maintype="image", subtype="png", filename=filename)
+	return msg
+
+
+def _read_attachment(path: str) -> Tuple[str, bytes]:
+	with open(path, "rb") as f:
+		return os.path.basename(path), f.read()
+
+
+def _encoded_size(size: int) -> int:
+	"""Approximate bytes an attachment adds to a message: base64 with CRLF every 76 chars plus part headers."""
+	encoded = (size + 2) // 3 * 4
+	return encoded + (encoded // 76 + 1) * 2 + ATTACHMENT_HEADER_BYTES
+
+
+def _is_transient(exc: Exception) -> bool:
+	"""Connection errors worth one retry: dropped sessions, network failures and 4xx replies."""
+	if isinstance(exc, smtplib.SMTPServerDisconnected):
 		return True
+	if isinstance(exc, smtplib.SMTPResponseException):
+		return 400 <= exc.smtp_code < 500
+	return isinstance(exc, OSError) and not isinstance(exc, smtplib.SMTPException)
+
+
+def _close(s: Optional[smtplib.SMTP]) -> None:
+	if s is None:
+		return
+	try:
+		s.close()
 	except Exception:
-		return False
\ No newline at end of file
+		pass
+
+
+def group_by_recipient(items: Sequence[PendingCertificate], max_bytes: int) -> List[List[int]]:
+	"""Group item indexes by recipient address (case-insensitive), splitting a recipient's
+	group so each message stays approximately under max_bytes. Items whose attachment
+	cannot be read are left out of every group.
+	"""
+	groups: Dict[str, List[List[int]]] = {}
+	sizes: Dict[str, int] = {}
+	for i, (to_email, _name, _event, path) in enumerate(items):
+		try:
+			size = _encoded_size(os.path.getsize(path))
+		except OSError:
+			continue
+		key = to_email.strip().lower()
+		chunks = groups.setdefault(key, [])
+		if not chunks or sizes[key] + size > max_bytes:
+			chunks.append([])
+			sizes[key] = MESSAGE_OVERHEAD_BYTES
+		chunks[-1].append(i)
+		sizes[key] += size
+	return [chunk for chunks in groups.values() for chunk in chunks]
+
+
+def _alive(s: smtplib.SMTP) -> bool:
+	"""Probe an idle session with NOOP before starting a new transaction on it."""
+	try:
+		return s.noop()[0] == 250
+	except Exception:
+		return False
+
+
+def _connect_with_retry(cfg: Dict) -> Optional[smtplib.SMTP]:
+	"""Open a session, retrying once on a transient error. Returns None if the server can't be reached."""
+	for attempt in range(2):
+		try:
+			return _connect(cfg)
+		except Exception as e:
+			if attempt == 0 and _is_transient(e):
+				continue
+			return None
+	return None
+
+
+def send_certificates(items: Sequence[PendingCertificate]) -> List[bool]:
+	"""Send pending certificates coalesced per recipient over a single SMTP connection.
+	A session that has died while idle (timeout, per-connection limit) is detected with
+	NOOP and replaced before the next message. A message that fails mid-transaction is
+	not resent, since the server may already have accepted it. If the server can't be
+	reached the run stops and the remaining items are reported as failed.
+	Returns a success flag for each item, in input order.
+	"""
+	results = [False] * len(items)
+	try:
+		cfg = _smtp_settings()
+	except ValueError:
+		return results
+	s = None
+	try:
+		for batch in group_by_recipient(items, cfg["max_bytes"]):
+			to_email, name = items[batch[0]][0], items[batch[0]][1]
+			try:
+				subject, body = render_certificate_text(name, [items[i][2] for i in batch])
+				attachments = [_read_attachment(items[i][3]) for i in batch]
+				msg = _build_message(cfg["mail_from"], to_email, subject, body, attachments)
+			except Exception:
+				continue
+			if s is not None and not _alive(s):
+				_close(s)
+				s = None
+			if s is None:
+				s = _connect_with_retry(cfg)
+				if s is None:
+					break
+			try:
+				s.send_message(msg)
+			except Exception:
+				# Drop the connection so the next batch starts from a clean session
+				_close(s)
+				s = None
+				continue
+			for i in batch:
+				results[i] = True
+	finally:
+		if s is not None:
+			try:
+				s.quit()
+			except Exception:
+				_close(s)
+	return results
@@ -0,0 +1,99 @@
+import json
+import os
+import shutil
+
+import pytest
+from PIL import Image
+
+from app.utils.cert_generator import _load_compiled, _parse_layout, compile_template, compiled_paths, generate_certificate_png
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_parse_layout_keeps_in_bounds_layout():
+	coords = {"fields": {"Name": {"x": 50, "y": 40, "font_size": 20}}, "qr": {"x": 10, "y": 10, "size": 30}}
+	layout = _parse_layout(coords, 100, 80)
+	assert layout["fields"]["Name"]["x"] == 50
+	assert layout["qr"] == {"x": 10, "y": 10, "size": 30}
+	assert layout["warnings"] == []
+
+
+def test_parse_layout_warns_on_field_outside_image():
+	layout = _parse_layout({"fields": {"Date": {"x": 50, "y": 500}}}, 100, 80)
+	assert layout["fields"]["Date"]["y"] == 500
+	assert "Date" in layout["warnings"][0]
+
+
+def test_parse_layout_clamps_overflowing_qr():
+	layout = _parse_layout({"qr": {"x": 90, "y": 70, "size": 30}}, 100, 80)
+	assert layout["qr"] == {"x": 70, "y": 50, "size": 30}
+	layout = _parse_layout({"qr": {"x": 0, "y": 0, "size": 200}}, 100, 80)
+	assert layout["qr"] == {"x": 0, "y": 0, "size": 80}
+	assert len(layout["warnings"]) == 1
+
+
+@pytest.mark.parametrize("coords", [
+	[],
+	{"fields": []},
+	{"fields": {"Name": {"x": "left"}}},
+	{"fields": {"Name": {"font_size": 0}}},
+	{"qr": {"size": -5}},
+])
+def test_parse_layout_rejects_malformed(coords):
+	with pytest.raises(ValueError):
+		_parse_layout(coords, 100, 80)
+
+
+def test_shipped_sample_compiles_and_renders(tmp_path):
+	template = str(tmp_path / "1.png")
+	shutil.copy(os.path.join(ROOT, "1.png"), template)
+	coords = os.path.join(ROOT, "coordinates.json")
+	thumb = str(tmp_path / "thumb.png")
+	layout = compile_template(template, coords, thumb)
+
+	raster_path, layout_path = compiled_paths(template)
+	assert os.path.getsize(raster_path) == layout["width"] * layout["height"] * 3
+	with open(layout_path, encoding="utf-8") as f:
+		assert json.load(f)["qr"] == layout["qr"]
+	with Image.open(thumb) as t:
+		assert t.width <= 320 and t.height <= 240
+
+	img, _ = _load_compiled(template)
+	with Image.open(template) as src:
+		assert img.tobytes() == src.convert("RGB").tobytes()
+	out = str(tmp_path / "out.png")
+	generate_certificate_png(template, coords, {"Name": "Ada"}, "https://example.com/verify?code=x", out)
+	with Image.open(out) as o:
+		assert o.size == (layout["width"], layout["height"])
+
+
+def test_fallback_renders_same_as_compiled(tmp_path):
+	template = str(tmp_path / "1.png")
+	shutil.copy(os.path.join(ROOT, "1.png"), template)
+	coords = os.path.join(ROOT, "coordinates.json")
+	fields = {"Name": "Ada", "Event": "Hack"}
+	qr = "https://example.com/verify?code=x"
+	plain = str(tmp_path / "plain.png")
+	generate_certificate_png(template, coords, fields, qr, plain)
+	compile_template(template, coords, str(tmp_path / "thumb.png"))
+	compiled = str(tmp_path / "compiled.png")
+	generate_certificate_png(template, coords, fields, qr, compiled)
+	with Image.open(plain) as a, Image.open(compiled) as b:
+		assert a.tobytes() == b.tobytes()
+
+
+def test_corrupt_layout_falls_back_to_decoding(tmp_path):
+	template = str(tmp_path / "t.png")
+	Image.new("RGB", (40, 30), "white").save(template)
+	coords = str(tmp_path / "coords.json")
+	with open(coords, "w", encoding="utf-8") as f:
+		json.dump({"fields": {}}, f)
+	compile_template(template, coords, str(tmp_path / "thumb.png"))
+	_, layout_path = compiled_paths(template)
+	with open(layout_path, "w", encoding="utf-8") as f:
+		f.write('{"width": 40, "hei')
+	assert _load_compiled(template) is None
+	out = str(tmp_path / "out.png")
+	generate_certificate_png(template, coords, {}, None, out)
+	with Image.open(out) as o:
+		assert o.size == (40, 30)
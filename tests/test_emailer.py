@@ -0,0 +1,150 @@
+import smtplib
+import socket
+
+import pytest
+
+from app.utils import emailer
+from app.utils.emailer import group_by_recipient, render_certificate_text, send_certificates
+
+
+class FakeSMTP:
+	"""Stand-in for smtplib.SMTP that records messages and closes the session after `limit` sends.
+	`connect_error` makes connecting fail; `lose_reply` accepts the next message but drops the reply."""
+
+	limit = None
+	connect_error = None
+	lose_reply = False
+	connections = 0
+	sent = []
+
+	def __init__(self, host, port, timeout=None):
+		FakeSMTP.connections += 1
+		if FakeSMTP.connect_error is not None:
+			raise FakeSMTP.connect_error
+		self.count = 0
+
+	def _closed(self):
+		return self.limit is not None and self.count >= self.limit
+
+	def noop(self):
+		if self._closed():
+			raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+		return 250, b"OK"
+
+	def starttls(self):
+		pass
+
+	def login(self, user, pwd):
+		pass
+
+	def send_message(self, msg):
+		if self._closed():
+			raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+		self.count += 1
+		FakeSMTP.sent.append(msg)
+		if FakeSMTP.lose_reply:
+			FakeSMTP.lose_reply = False
+			raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+
+	def quit(self):
+		pass
+
+	def close(self):
+		pass
+
+
+@pytest.fixture
+def fake_smtp(monkeypatch):
+	FakeSMTP.limit = None
+	FakeSMTP.connect_error = None
+	FakeSMTP.lose_reply = False
+	FakeSMTP.connections = 0
+	FakeSMTP.sent = []
+	monkeypatch.setattr(emailer.smtplib, "SMTP", FakeSMTP)
+	return FakeSMTP
+
+
+def _cert(tmp_path, name, size=300):
+	path = tmp_path / f"{name}.png"
+	path.write_bytes(b"x" * size)
+	return str(path)
+
+
+def test_group_by_recipient_folds_case_and_splits_on_cap(tmp_path):
+	items = [
+		("Ann@x.com", "Ann", "Hack", _cert(tmp_path, "a")),
+		("bob@x.com", "Bob", "Hack", _cert(tmp_path, "b")),
+		("ann@x.com ", "Ann", "Talk", _cert(tmp_path, "c")),
+	]
+	assert group_by_recipient(items, 10 ** 6) == [[0, 2], [1]]
+	# Cap fits one attachment plus message overhead, but not two
+	cap = emailer.MESSAGE_OVERHEAD_BYTES + emailer._encoded_size(300) + 1
+	assert group_by_recipient(items, cap) == [[0], [2], [1]]
+
+
+def test_group_by_recipient_skips_missing_files(tmp_path):
+	items = [
+		("ann@x.com", "Ann", "Hack", str(tmp_path / "gone.png")),
+		("ann@x.com", "Ann", "Talk", _cert(tmp_path, "c")),
+	]
+	assert group_by_recipient(items, 10 ** 6) == [[1]]
+
+
+def test_render_certificate_text_dedupes_and_drops_empty_events():
+	subject, body = render_certificate_text("Ann", ["Hack", "", "Talk", "Hack"])
+	assert subject == "Your Certificates for Hack, Talk"
+	assert "your certificates for Hack, Talk." in body
+	subject, _ = render_certificate_text("Ann", ["Hack", "Hack"])
+	assert subject == "Your Certificate for Hack"
+	subject, _ = render_certificate_text("Ann", [""])
+	assert subject == "Your Certificate for "
+
+
+def test_send_certificates_coalesces_per_recipient(tmp_path, fake_smtp):
+	items = [
+		("ann@x.com", "Ann", "Hack", _cert(tmp_path, "a")),
+		("bob@x.com", "Bob", "Hack", _cert(tmp_path, "b")),
+		("ann@x.com", "Ann", "Talk", _cert(tmp_path, "c")),
+	]
+	assert send_certificates(items) == [True, True, True]
+	assert fake_smtp.connections == 1
+	assert len(fake_smtp.sent) == 2
+	assert len(list(fake_smtp.sent[0].iter_attachments())) == 2
+
+
+def test_send_certificates_reconnects_after_disconnect(tmp_path, fake_smtp):
+	fake_smtp.limit = 1
+	items = [
+		("ann@x.com", "Ann", "Hack", _cert(tmp_path, "a")),
+		("bob@x.com", "Bob", "Hack", _cert(tmp_path, "b")),
+		("cy@x.com", "Cy", "Hack", _cert(tmp_path, "c")),
+	]
+	assert send_certificates(items) == [True, True, True]
+	assert fake_smtp.connections == 3
+	assert [m["To"] for m in fake_smtp.sent] == ["ann@x.com", "bob@x.com", "cy@x.com"]
+
+
+def test_send_certificates_marks_missing_file_only(tmp_path, fake_smtp):
+	items = [
+		("ann@x.com", "Ann", "Hack", str(tmp_path / "gone.png")),
+		("bob@x.com", "Bob", "Hack", _cert(tmp_path, "b")),
+	]
+	assert send_certificates(items) == [False, True]
+
+
+def test_send_certificates_does_not_resend_after_lost_reply(tmp_path, fake_smtp):
+	fake_smtp.lose_reply = True
+	items = [
+		("ann@x.com", "Ann", "Hack", _cert(tmp_path, "a")),
+		("bob@x.com", "Bob", "Hack", _cert(tmp_path, "b")),
+	]
+	assert send_certificates(items) == [False, True]
+	assert [m["To"] for m in fake_smtp.sent] == ["ann@x.com", "bob@x.com"]
+	assert fake_smtp.connections == 2
+
+
+def test_send_certificates_stops_when_server_unreachable(tmp_path, fake_smtp):
+	fake_smtp.connect_error = socket.timeout("timed out")
+	items = [(f"u{i}@x.com", "U", "Hack", _cert(tmp_path, f"u{i}")) for i in range(5)]
+	assert send_certificates(items) == [False] * 5
+	assert fake_smtp.connections == 2